@@ -1,10 +1,29 @@
-import functools
+import hashlib
+import json
+import re
+import threading
 from typing import Callable, List, Optional, Type
-from flask import Flask, Blueprint, jsonify, abort, render_template
+from flask import Flask, Blueprint, Response, abort, render_template, request
 from flask.views import MethodView
 from pydantic import BaseModel
 from .utils import parse_url, get_summary_desc, merge_dicts
 
+try:
+    import orjson
+
+    _dumps = orjson.dumps
+except ImportError:
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+
+try:
+    from pydantic.json_schema import models_json_schema  # pydantic v2
+except ImportError:  # pydantic v1
+    models_json_schema = None
+
+
 OPENAPI_VERSION = "3.0.2"
 OPENAPI_INFO = dict(
     title="Service Documents",
@@ -20,6 +39,47 @@ OPENAPI_TEMPLATE_FOLDER = "templates"
 OPENAPI_FILENAME = "openapi.json"
 OPENAPI_UI = "swagger"
 
+_SKIP_METHODS = frozenset({"HEAD", "OPTIONS"})
+_SCHEMA_SLOTS = ("query", "body", "response")
+
+# templates copied into each operation, since extra_props may merge
+# into any response in place
+_SUCCESS_RESPONSE = {"description": "Successful Response"}
+_VALIDATION_ERROR_RESPONSE = {"description": "Validation Error"}
+
+
+def _response_def_name(code: str, msg: str) -> str:
+    """
+    build a components.responses key like ``Err_404_NotFound``
+    """
+    slug = "".join(part.capitalize() for part in re.findall(r"[A-Za-z0-9]+", msg))
+    return f"Err_{code}_{slug}" if slug else f"Err_{code}"
+
+
+_SCHEMAS_REF_PREFIX = "#/components/schemas/"
+
+
+def _reachable_defs(schema: dict, defs: dict) -> dict:
+    """
+    collect the subset of `defs` reachable from `schema` via ``$ref``, so
+    a cached model replays only its own nested definitions
+    """
+    reachable = {}
+    stack = [schema]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if isinstance(ref, str) and ref.startswith(_SCHEMAS_REF_PREFIX):
+                name = ref[len(_SCHEMAS_REF_PREFIX):]
+                if name in defs and name not in reachable:
+                    reachable[name] = defs[name]
+                    stack.append(defs[name])
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+    return reachable
+
 
 class APIView(MethodView):
     def __init__(self, *args, **kwargs):
@@ -44,7 +104,10 @@ class APIError:
 
 
 class OpenAPI:
-    _models = {}
+    # model class -> generated schema, so repeated decorator applications
+    # of the same model only pay for schema generation once; shared across
+    # instances since generation is pure per model class
+    _schema_cache = {}
 
     def __init__(
         self,
@@ -58,6 +121,7 @@ class OpenAPI:
         openapi_info: dict = OPENAPI_INFO,
         ui: str = OPENAPI_UI,
         extra_props: dict = {},
+        prebuild: bool = False,
     ) -> None:
         if not endpoint.endswith("/"):
             endpoint += "/"
@@ -71,8 +135,21 @@ class OpenAPI:
         self.info: dict = openapi_info
         self.ui: str = ui
         self.extra_props: dict = extra_props
+        self.prebuild: bool = prebuild
 
         self._spec = None
+        self._spec_bytes = None
+        self._spec_etag = None
+        self._spec_lock = threading.Lock()
+        # per-instance registries so multiple apps (or test fixtures)
+        # don't leak models into each other's specs
+        self._models = {}
+        # model name -> {"$ref": ...}, built once per model and shared by
+        # reference everywhere the spec points at that schema
+        self._refs = {}
+        # models queued by add_model, schema-generated in one batch on the
+        # first spec build
+        self._pending_models = []
 
     def register(self, app: Flask) -> None:
         assert isinstance(app, Flask)
@@ -97,27 +174,60 @@ class OpenAPI:
         @blueprint.route(f"{self.endpoint}<filename>")
         def ___jsonfile___(filename: str):
             if filename == self.filename:
-                return jsonify(self.spec)
+                body = self._get_spec_bytes()
+                # the spec is static post-boot, so repeat doc loads can be
+                # answered with 304 Not Modified
+                if request.if_none_match and self._spec_etag in request.if_none_match:
+                    return Response(status=304)
+                resp = Response(body, mimetype="application/json")
+                resp.set_etag(self._spec_etag)
+                return resp
             abort(404)
 
         self.app.register_blueprint(blueprint)
 
+        # warm the spec cache off the request path so the first
+        # /docs/openapi.json fetch returns immediately
+        if self.prebuild:
+            threading.Thread(target=lambda: self.spec, daemon=True).start()
+
     @property
     def spec(self):
         if self._spec is None:
-            self._spec = self.generate_spec()
+            with self._spec_lock:
+                if self._spec is None:
+                    self._spec = self.generate_spec()
         return self._spec
 
+    def _get_spec_bytes(self) -> bytes:
+        if self._spec_bytes is None:
+            spec_bytes = _dumps(self.spec)
+            self._spec_etag = hashlib.blake2b(
+                spec_bytes, digest_size=16
+            ).hexdigest()
+            self._spec_bytes = spec_bytes
+        return self._spec_bytes
+
+    def invalidate(self) -> None:
+        """
+        drop the cached spec (dict and serialized bytes) so the next
+        access rebuilds it
+        """
+        self._spec = None
+        self._spec_bytes = None
+        self._spec_etag = None
+        parse_url.cache_clear()
+
     def _bypass(self, func) -> bool:
         if self.mode == "greedy":
             return False
         elif self.mode == "strict":
-            if getattr(func, "_openapi", None) == self.__class__:
+            if getattr(func, "_openapi", None) is self:
                 return False
             return True
         else:
             decorator = getattr(func, "_openapi", None)
-            if decorator and decorator != self.__class__:
+            if decorator and decorator is not self:
                 return True
             return False
 
@@ -125,164 +235,261 @@ class OpenAPI:
         """
         generate OpenAPI spec JSON file
         """
+        self._finalize_models()
 
         routes = {}
         tags = {}
+        # (code, msg) -> components.responses name, so identical error
+        # responses are defined once and referenced per operation
+        response_defs = {}
+
+        skip_prefixes = (f"{self.url_prefix or ''}{self.endpoint}", "/static")
 
+        # group rules by endpoint so the view-function lookup and the
+        # attribute snapshot are paid once per function, not once per rule
+        rules_by_endpoint = {}
         for rule in self.app.url_map.iter_rules():
-            if str(rule).startswith(
-                (f"{self.url_prefix or ''}{self.endpoint}", "/static")
-            ):
-                continue
+            rules_by_endpoint.setdefault(rule.endpoint, []).append(rule)
 
-            func = self.app.view_functions[rule.endpoint]
-            path, parameters = parse_url(str(rule))
+        for endpoint, rules in rules_by_endpoint.items():
+            func = self.app.view_functions[endpoint]
 
             # bypass the function decorated by others
             if self._bypass(func):
                 continue
 
-            # multiple methods (with different func) may bond to the same path
-            if path not in routes:
-                routes[path] = {}
-
-            for method in rule.methods:
-                if method in ["HEAD", "OPTIONS"]:
+            # snapshot the decorator attributes once per function instead of
+            # probing with hasattr for every method
+            tags_ = getattr(func, "tags", None)
+            body_ = getattr(func, "body", None)
+            query_ = getattr(func, "query", None)
+            response_ = getattr(func, "response", None)
+            exceptions_ = getattr(func, "exceptions", None)
+            summary, desc = get_summary_desc(func)
+
+            for rule in rules:
+                rule_str = str(rule)
+                if rule_str.startswith(skip_prefixes):
                     continue
 
-                if hasattr(func, "tags"):
-                    for tag in func.tags:
-                        if tag not in tags:
-                            tags[tag] = {"name": tag}
-
-                summary, desc = get_summary_desc(func)
-                spec = {
-                    "summary": summary or func.__name__.capitalize(),
-                    "description": desc or "",
-                    "operationId": func.__name__ + "__" + method.lower(),
-                    "tags": getattr(func, "tags", []),
-                }
-
-                if hasattr(func, "body"):
-                    spec["requestBody"] = {
-                        "content": {
-                            "application/json": {
-                                "schema": {"$ref": f"#/components/schemas/{func.body}"}
+                path, parameters = parse_url(rule_str)
+
+                # multiple methods (with different func) may bond to the
+                # same path
+                if path not in routes:
+                    routes[path] = {}
+
+                for method in rule.methods - _SKIP_METHODS:
+                    method_lower = method.lower()
+
+                    if tags_:
+                        for tag in tags_:
+                            if tag not in tags:
+                                tags[tag] = {"name": tag}
+
+                    spec = {
+                        "summary": summary or func.__name__.capitalize(),
+                        "description": desc or "",
+                        "operationId": func.__name__ + "__" + method_lower,
+                        "tags": tags_ or [],
+                    }
+
+                    if body_:
+                        spec["requestBody"] = {
+                            "content": {
+                                "application/json": {"schema": self._ref_for(body_)}
                             }
                         }
-                    }
 
-                params = parameters[:]
-                if hasattr(func, "query"):
-                    params.append(
-                        {
-                            "name": func.query,
-                            "in": "query",
-                            "required": True,
-                            "schema": {
-                                "$ref": f"#/components/schemas/{func.query}",
+                    params = parameters[:]
+                    if query_:
+                        params.append(
+                            {
+                                "name": query_,
+                                "in": "query",
+                                "required": True,
+                                "schema": self._ref_for(query_),
+                            }
+                        )
+                    spec["parameters"] = params
+
+                    responses = {}
+                    has_2xx = False
+                    if exceptions_:
+                        for code, msg in exceptions_.items():
+                            if code.startswith("2"):
+                                has_2xx = True
+                            name = response_defs.get((code, msg))
+                            if name is None:
+                                name = _response_def_name(code, msg)
+                                # same slug from a different msg, e.g.
+                                # differing only in punctuation
+                                while name in response_defs.values():
+                                    name += "_"
+                                response_defs[(code, msg)] = name
+                            responses[code] = {
+                                "$ref": f"#/components/responses/{name}"
+                            }
+
+                    if response_:
+                        responses["200"] = {
+                            "description": "Successful Response",
+                            "content": {
+                                "application/json": {
+                                    "schema": self._ref_for(response_)
+                                }
                             },
                         }
-                    )
-                spec["parameters"] = params
-
-                spec["responses"] = {}
-                has_2xx = False
-                if hasattr(func, "exceptions"):
-                    for code, msg in func.exceptions.items():
-                        if code.startswith("2"):
-                            has_2xx = True
-                        spec["responses"][code] = {
-                            "description": msg,
-                        }
+                    elif not has_2xx:
+                        responses["200"] = dict(_SUCCESS_RESPONSE)
 
-                if hasattr(func, "response"):
-                    spec["responses"]["200"] = {
-                        "description": "Successful Response",
-                        "content": {
-                            "application/json": {
-                                "schema": {
-                                    "$ref": f"#/components/schemas/{func.response}"
-                                }
-                            }
-                        },
-                    }
-                elif not has_2xx:
-                    spec["responses"]["200"] = {"description": "Successful Response"}
-
-                if any(
-                    [hasattr(func, schema) for schema in ("query", "body", "response")]
-                ):
-                    spec["responses"]["400"] = {
-                        "description": "Validation Error",
-                    }
+                    if query_ or body_ or response_:
+                        responses["400"] = dict(_VALIDATION_ERROR_RESPONSE)
 
-                routes[path][method.lower()] = spec
+                    spec["responses"] = responses
 
-        schemas = {}
-        for name, model in self._models.items():
-            schemas[name] = model
-            if "definitions" in model:
-                for key, value in model["definitions"].items():
-                    schemas[key] = value
-                del model["definitions"]
+                    routes[path][method_lower] = spec
 
         data = {
             "openapi": self.openapi_version,
             "info": self.info,
             "tags": list(tags.values()),
-            "paths": {**routes},
+            "paths": routes,
             "components": {
-                "schemas": schemas,
+                "schemas": self._models,
             },
         }
 
+        if response_defs:
+            data["components"]["responses"] = {
+                name: {"description": msg}
+                for (_, msg), name in response_defs.items()
+            }
+
         merge_dicts(data, self.extra_props)
 
         return data
 
-    @classmethod
-    def add_model(cls, model):
-        cls._models[model.__name__] = model.schema(
-            ref_template="#/components/schemas/{model}"
-        )
+    def _ref_for(self, name: str) -> dict:
+        # greedy mode documents views decorated by another instance, whose
+        # models were never registered here; build the ref on first use
+        ref = self._refs.get(name)
+        if ref is None:
+            ref = self._refs[name] = {"$ref": f"{_SCHEMAS_REF_PREFIX}{name}"}
+        return ref
+
+    def add_model(self, model) -> None:
+        self._refs[model.__name__] = {
+            "$ref": f"{_SCHEMAS_REF_PREFIX}{model.__name__}"
+        }
+        cached = self._schema_cache.get(model)
+        if cached is not None:
+            schema, defs = cached
+            self._models[model.__name__] = schema
+            if defs:
+                self._models.update(defs)
+        elif model not in self._pending_models:
+            self._pending_models.append(model)
+
+    def _finalize_models(self) -> None:
+        """
+        generate schemas for the models queued by `add_model`
+
+        On pydantic v2 all pending models share a single schema generator
+        via `models_json_schema`, so common sub-schemas are built once.
+        Falls back to per-model `.schema()` on pydantic v1, where the
+        nested ``definitions`` are split off here — once, at generation
+        time — so the spec build never has to post-process or mutate
+        registered schemas. The cache keeps ``(schema, defs)`` pairs,
+        with `defs` limited to the definitions reachable from that model,
+        so a replay for another instance registers the nested schemas too
+        without dragging in the rest of the batch.
+        """
+        if not self._pending_models:
+            return
+        pending, self._pending_models = self._pending_models, []
+        if models_json_schema is not None:
+            refs_map, defs = models_json_schema(
+                [(model, "validation") for model in pending],
+                ref_template="#/components/schemas/{model}",
+            )
+            batch_defs = defs.get("$defs", {})
+            self._models.update(batch_defs)
+            for model in pending:
+                # the $defs key can differ from __name__ when pydantic
+                # disambiguates colliding model names
+                defs_key = refs_map[(model, "validation")]["$ref"].rsplit(
+                    "/", 1
+                )[-1]
+                schema = batch_defs.get(defs_key, {})
+                self._models[model.__name__] = schema
+                self._schema_cache[model] = (
+                    schema,
+                    _reachable_defs(schema, batch_defs),
+                )
+        else:
+            for model in pending:
+                schema = model.schema(ref_template="#/components/schemas/{model}")
+                defs = schema.pop("definitions", None)
+                self._schema_cache[model] = (schema, defs)
+                self._models[model.__name__] = schema
+                if defs:
+                    self._models.update(defs)
+
+    def docs(
+        self,
+        response: Optional[Type[BaseModel]] = None,
+        exceptions: List[APIError] = [],
+        tags: List[str] = [],
+    ) -> Callable:
+        """
+        decorator registering a view function and its models with this
+        OpenAPI instance
+        """
+
+        def decorate(func: Callable) -> Callable:
+            # the decorator is marker-only: it tags `func` with the metadata
+            # generate_spec reads and returns it as-is, so decorated routes
+            # don't pay for an extra call frame per request
+            anno = getattr(func, "__annotations__", {}) or {}
+            query = anno.get("query") or getattr(func, "_query", None)
+            body = anno.get("body") or getattr(func, "_body", None)
+
+            # register schemas to this function
+            for model, name in zip((query, body, response), _SCHEMA_SLOTS):
+                if model:
+                    assert issubclass(model, BaseModel)
+                    self.add_model(model)
+                    setattr(func, name, model.__name__)
+
+            # store exception for doc
+            api_errs = {}
+            for e in exceptions:
+                assert isinstance(e, APIError)
+                api_errs[str(e.code)] = e.msg
+            if api_errs:
+                setattr(func, "exceptions", api_errs)
+
+            if tags:
+                setattr(func, "tags", tags)
+
+            # mark the function as documented by this instance
+            setattr(func, "_openapi", self)
+
+            return func
+
+        return decorate
 
 
 def openapi_docs(
+    openapi: OpenAPI,
     response: Optional[Type[BaseModel]] = None,
     exceptions: List[APIError] = [],
     tags: List[str] = [],
 ):
-    def decorate(func: Callable) -> Callable:
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            res = func(*args, **kwargs)
-            return res
-
-        query = func.__annotations__.get("query") or getattr(func, "_query", None)
-        body = func.__annotations__.get("body") or getattr(func, "_body", None)
-
-        # register schemas to this function
-        for model, name in zip((query, body, response), ("query", "body", "response")):
-            if model:
-                assert issubclass(model, BaseModel)
-                OpenAPI.add_model(model)
-                setattr(wrapper, name, model.__name__)
-
-        # store exception for doc
-        api_errs = {}
-        for e in exceptions:
-            assert isinstance(e, APIError)
-            api_errs[str(e.code)] = e.msg
-        if api_errs:
-            setattr(wrapper, "exceptions", api_errs)
-
-        if tags:
-            setattr(wrapper, "tags", tags)
-
-        # register OpenAPI class
-        setattr(wrapper, "_openapi", OpenAPI)
-
-        return wrapper
-
-    return decorate
+    """
+    module-level alias for `OpenAPI.docs`; models were previously
+    registered on the class, so the decorator now takes the `OpenAPI`
+    instance the route belongs to
+    """
+    return openapi.docs(response=response, exceptions=exceptions, tags=tags)
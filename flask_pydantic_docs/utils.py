@@ -1,3 +1,4 @@
+import functools
 import inspect
 from werkzeug.routing import parse_rule, parse_converter_args
 
@@ -18,6 +19,47 @@ def get_summary_desc(func):
     return doc
 
 
+# constant templates for the arg-free converters; copied on use so
+# callers can safely extend the returned dict
+_FLOAT_SCHEMA = {"type": "number", "format": "float"}
+_UUID_SCHEMA = {"type": "string", "format": "uuid"}
+_PATH_SCHEMA = {"type": "string", "format": "path"}
+_DEFAULT_SCHEMA = {"type": "string"}
+
+
+def _any_schema(*args, **kwargs):
+    return {"type": "array", "items": {"type": "string", "enum": args}}
+
+
+def _int_schema(*args, **kwargs):
+    return {
+        "type": "integer",
+        "format": "int32",
+        **{f"{prop}imum": kwargs[prop] for prop in ["min", "max"] if prop in kwargs},
+    }
+
+
+def _string_schema(*args, **kwargs):
+    return {
+        "type": "string",
+        **{
+            prop: kwargs[prop]
+            for prop in ["length", "maxLength", "minLength"]
+            if prop in kwargs
+        },
+    }
+
+
+_CONVERTER_DISPATCH = {
+    "any": _any_schema,
+    "int": _int_schema,
+    "float": lambda *args, **kwargs: _FLOAT_SCHEMA.copy(),
+    "uuid": lambda *args, **kwargs: _UUID_SCHEMA.copy(),
+    "path": lambda *args, **kwargs: _PATH_SCHEMA.copy(),
+    "string": _string_schema,
+}
+
+
 def get_converter_schema(converter: str, *args, **kwargs):
     """
     Get conveter method from converter map
@@ -30,42 +72,17 @@ def get_converter_schema(converter: str, *args, **kwargs):
     :return: return schema dict
 
     """
-    if converter == "any":
-        return {"type": "array", "items": {"type": "string", "enum": args}}
-    elif converter == "int":
-        return {
-            "type": "integer",
-            "format": "int32",
-            **{
-                f"{prop}imum": kwargs[prop] for prop in ["min", "max"] if prop in kwargs
-            },
-        }
-    elif converter == "float":
-        return {"type": "number", "format": "float"}
-    elif converter == "uuid":
-        return {"type": "string", "format": "uuid"}
-    elif converter == "path":
-        return {"type": "string", "format": "path"}
-    elif converter == "string":
-        return {
-            "type": "string",
-            **{
-                prop: kwargs[prop]
-                for prop in ["length", "maxLength", "minLength"]
-                if prop in kwargs
-            },
-        }
-    else:
-        return {"type": "string"}
+    builder = _CONVERTER_DISPATCH.get(converter)
+    if builder is None:
+        return _DEFAULT_SCHEMA.copy()
+    return builder(*args, **kwargs)
 
 
-def parse_url(path: str):
+@functools.lru_cache(maxsize=None)
+def _parse_url_cached(path: str):
     """
-    Parsing Flask route url to get the normal url path and parameter type.
-
-    Based on Werkzeug_ builtin converters.
-
-    .. _werkzeug: https://werkzeug.palletsprojects.com/en/0.15.x/routing/#builtin-converters
+    cached worker for `parse_url`; returns the parameters as a tuple so
+    the cached value stays hashable and immutable
     """
     subs = []
     parameters = []
@@ -92,18 +109,46 @@ def parse_url(path: str):
             }
         )
 
-    return "".join(subs), parameters
+    return "".join(subs), tuple(parameters)
+
+
+def parse_url(path: str):
+    """
+    Parsing Flask route url to get the normal url path and parameter type.
+
+    Based on Werkzeug_ builtin converters. Results are memoized per path
+    string since the URL map is static after app init; call
+    ``parse_url.cache_clear()`` to reset.
+
+    .. _werkzeug: https://werkzeug.palletsprojects.com/en/0.15.x/routing/#builtin-converters
+    """
+    normal_path, parameters = _parse_url_cached(path)
+    return normal_path, list(parameters)
+
+
+parse_url.cache_clear = _parse_url_cached.cache_clear
+
 
 def merge_dicts(d1, d2):
-    for k, v in d1.items():
-        if k in d2:
-            v2 = d2.pop(k)
-            if isinstance(v, dict):
-                if isinstance(v2, dict):
-                    merge_dicts(v, v2)
-                else:
-                    d1[k] = v2
+    """
+    Merge `d2` into `d1` in place and return `d1`.
+
+    Values from `d2` win unless both sides hold a dict, in which case the
+    pair is merged recursively. Nested dicts in `d1` are replaced by
+    shallow copies before being written, so sub-dicts shared by reference
+    elsewhere (precomputed `$ref` objects, cached schemas) are never
+    mutated through a merge. Uses an explicit stack instead of recursion
+    and leaves `d2` untouched.
+    """
+    stack = [(d1, d2)]
+    while stack:
+        dst, src = stack.pop()
+        for k, v in src.items():
+            cur = dst.get(k)
+            if isinstance(v, dict) and isinstance(cur, dict):
+                cur = dict(cur)
+                dst[k] = cur
+                stack.append((cur, v))
             else:
-                d1[k] = v2
-    d1.update(d2)
+                dst[k] = v
     return d1
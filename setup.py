@@ -23,5 +23,5 @@ setup(
         "flask-pydantic",
     ],
     zip_safe=False,
-    extras_require={},
+    extras_require={"fast": ["orjson"]},
 )